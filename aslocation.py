@@ -1,42 +1,32 @@
-import json
-import re
-import time
 import os
-import pandas as pd
-import random
+import asyncio
+import argparse
 import logging
-import urllib.parse
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import WebDriverException
-
-# === CONFIGURATION ===
-MIN_DELAY = 5
-MAX_DELAY = 8
-CHECKPOINT_FILE = "emails_result.json"
-
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[logging.StreamHandler(), logging.FileHandler("scraper.log")]
-)
+from scraper_core import reextract_from_cache, scrape
 
 def load_locations_from_excel(file_path):
     """
     Load USA locations from the 4th column of the Excel file.
     """
     try:
-        # Read the Excel file
-        df = pd.read_excel(file_path)
+        # Imported here so processes that never read Excel don't pay for it
+        from openpyxl import load_workbook
 
-        # Extract the 4th column (index 3 since indexing starts from 0)
-        usa_locations = df.iloc[:, 3].dropna().astype(str).str.strip()
+        # Stream the workbook instead of loading it whole; only one column is needed
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            ws = wb.worksheets[0]
+            # Extract the 4th column, skipping the header row
+            usa_locations = [
+                str(row[0]).strip()
+                for row in ws.iter_rows(min_row=2, min_col=4, max_col=4, values_only=True)
+                if row[0] is not None
+            ]
+        finally:
+            wb.close()
 
         # Remove empty strings and duplicates while preserving order
-        seen = set()
-        unique_locations = [loc for loc in usa_locations if loc and not (loc in seen or seen.add(loc))]
+        unique_locations = list(dict.fromkeys(loc for loc in usa_locations if loc))
 
         if not unique_locations:
             logging.error("❌ No valid USA locations found in column index 3.")
@@ -48,142 +38,37 @@ def load_locations_from_excel(file_path):
         logging.error(f"❌ Error loading Excel file: {str(e)}")
         return []
 
-
-def load_checkpoint(checkpoint_file=CHECKPOINT_FILE):
+def location_queries(locations):
     """
-    Load existing results from the checkpoint file to resume scraping.
+    Yield the (query, location) search for each location.
     """
-    if os.path.exists(checkpoint_file):
-        try:
-            with open(checkpoint_file, "r") as f:
-                content = f.read().strip()
-                if not content:
-                    logging.info(f"⚠️ Checkpoint file {checkpoint_file} is empty. Starting fresh.")
-                    return {}
-                return json.loads(content)
-        except json.JSONDecodeError as e:
-            logging.error(f"❌ Corrupted checkpoint file: {e}. Starting fresh.")
-            return {}
-        except Exception as e:
-            logging.error(f"❌ Error loading checkpoint file: {e}")
-            return {}
-    return {}
+    for location in locations:
+        yield f'site:linkedin.com construction in "{location}" "email" "com" -india', location
 
-def save_checkpoint(email_results, checkpoint_file=CHECKPOINT_FILE):
+async def scrape_google_emails(extension_path, extension_path2, locations, use_cache=True):
     """
-    Save current results to the checkpoint file.
+    Scrape Google search results for emails using the provided UK locations.
+    Results are keyed by location.
     """
-    try:
-        with open(checkpoint_file, "w") as f:
-            json.dump(email_results, f, indent=4)
-        logging.info(f"💾 Checkpoint saved to: {checkpoint_file}")
-    except Exception as e:
-        logging.error(f"❌ Error saving checkpoint: {str(e)}")
-
-def initialize_driver(extension_path, extension_path2):
+    return await scrape(
+        location_queries(locations),
+        key_fn=lambda location: location,
+        extension_paths=(extension_path, extension_path2),
+        use_cache=use_cache
+    )
+
+def reextract_emails(locations):
     """
-    Initialize the Chrome WebDriver with specified extensions.
+    Re-run email extraction for the given locations from cached result pages only.
     """
-    if not os.path.exists(extension_path):
-        raise FileNotFoundError(f"Extension file not found at: {extension_path}")
-    if not os.path.exists(extension_path2):
-        raise FileNotFoundError(f"Buster extension file not found at: {extension_path2}")
-
-    chrome_options = Options()
-    chrome_options.add_argument("--start-maximized")
-    chrome_options.add_extension(extension_path)
-    chrome_options.add_extension(extension_path2)
-    user_agents = [
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:131.0) Gecko/20100101 Firefox/131.0"
-    ]
-    chrome_options.add_argument(f"user-agent={random.choice(user_agents)}")
-    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-
-    try:
-        driver = webdriver.Chrome(service=Service(), options=chrome_options)
-        return driver
-    except Exception as e:
-        logging.error(f"❌ Error initializing WebDriver: {str(e)}")
-        return None
-
-def scrape_google_emails(extension_path, extension_path2, locations):
-    """
-    Scrape Google search results for emails using the provided UK locations.
-    Uses the query: site:intelius.com construction in "{location}" "//@gmail.com" -india
-    """
-    email_results = load_checkpoint()
-    driver = None
-
-    try:
-        driver = initialize_driver(extension_path, extension_path2)
-        if not driver:
-            raise Exception("Failed to initialize WebDriver")
-
-        # Process each UK location
-        for location in locations:
-            if location in email_results:
-                logging.info(f"⏭️ Skipping already processed location: {location}")
-                continue
-
-            # Construct the search query
-            query = f'site:linkedin.com construction in "{location}" "email" "com" -india'
-            logging.info(f"🔍 Searching: {query}")
-            # Properly encode the query for the URL
-            encoded_query = urllib.parse.quote(query)
-            url = f'https://www.google.com/search?q={encoded_query}&num=50'
-            logging.info(f"🌐 Constructed URL: {url}")
-            try:
-                driver.get(url)
-                time.sleep(random.uniform(MIN_DELAY, MAX_DELAY))
-
-                # Scroll to load more results
-                last_height = driver.execute_script("return document.body.scrollHeight")
-                while True:
-                    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                    time.sleep(random.uniform(8, 12))
-                    new_height = driver.execute_script("return document.body.scrollHeight")
-                    if new_height == last_height:
-                        break
-                    last_height = new_height
-                    time.sleep(random.uniform(5, 7))
-
-                page_html = driver.page_source
-                # Improved email regex to exclude image formats
-                emails = set(re.findall(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.(?!png|jpg|jpeg)[a-zA-Z]{2,}', page_html))
-                email_results[location] = sorted(list(emails))
-
-                logging.info(f"📧 Found {len(emails)} email(s) for: {location}")
-                for email in emails:
-                    logging.info(email)
-
-                save_checkpoint(email_results)
-
-            except WebDriverException as e:
-                logging.error(f"❌ WebDriver error for {location}: {e}")
-                if driver:
-                    driver.quit()
-                driver = initialize_driver(extension_path, extension_path2)
-                if not driver:
-                    logging.error(f"❌ Failed to restart WebDriver. Saving current results and exiting.")
-                    save_checkpoint(email_results)
-                    return email_results
-                logging.info(f"🔄 WebDriver restarted. Retrying {location}.")
-                continue
-
-    except Exception as e:
-        logging.error(f"❌ Error during scraping: {str(e)}")
-        save_checkpoint(email_results)
-
-    finally:
-        if driver:
-            driver.quit()
-            logging.info("🛑 Browser closed.")
-
-    return email_results
+    return reextract_from_cache(location_queries(locations), key_fn=lambda location: location)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape Google search results for emails by location.")
+    parser.add_argument("--no-cache", action="store_true", help="Fetch every result page again instead of using serp_cache")
+    parser.add_argument("--reextract", action="store_true", help="Rebuild results from serp_cache without fetching anything")
+    args = parser.parse_args()
+
     extension_path = "/Users/surindersuri/Desktop/email/KDPLAPECIAGKKJOIGNNKFPBFKEBCFBPB_0_3_24_0.crx"
     extension_path2 = "/Users/surindersuri/Desktop/email/Buster.crx"
     excel_file_path = "/Users/surindersuri/Desktop/email/country.xlsx"
@@ -198,7 +83,10 @@ if __name__ == "__main__":
             logging.error("❗ No UK locations loaded. Exiting.")
             exit(1)
 
-        all_emails = scrape_google_emails(extension_path, extension_path2, locations)
+        if args.reextract:
+            all_emails = reextract_emails(locations)
+        else:
+            all_emails = asyncio.run(scrape_google_emails(extension_path, extension_path2, locations, use_cache=not args.no_cache))
         total = sum(len(emails) for emails in all_emails.values())
         logging.info(f"✅ All scraping done. Total unique emails found: {total}")
 
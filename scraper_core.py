@@ -0,0 +1,532 @@
+"""
+Google email scraping shared by the location (aslocation.py) and keyword (keyword001.py) scripts.
+"""
+import re
+import time
+import os
+import gzip
+import hashlib
+import random
+import shutil
+import logging
+import threading
+import queue
+import asyncio
+import atexit
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+import httpx
+import orjson
+import zstandard as zstd
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chromium.remote_connection import ChromiumRemoteConnection
+from selenium.webdriver.common.driver_finder import DriverFinder
+from selenium.common.exceptions import WebDriverException
+
+# RE2 matches in linear time; fall back to the stdlib engine when it isn't installed
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+# === CONFIGURATION ===
+MIN_DELAY = 0.5
+MAX_DELAY = 1
+MAX_SCROLLS = 5
+SCROLL_PAUSE = 1.5
+CHECKPOINT_FILE = "emails_result.json"
+# Checkpoints are stored zstd-compressed as CHECKPOINT_FILE + ".zst"
+CHECKPOINT_COMPRESSOR = zstd.ZstdCompressor(level=3)
+CHECKPOINT_DECOMPRESSOR = zstd.ZstdDecompressor()
+# Raw result pages, gzipped and keyed by URL hash, so re-runs don't hit Google again
+CACHE_DIR = "serp_cache"
+# Set to False to watch the browser (e.g. when debugging CAPTCHA fallbacks)
+HEADLESS = True
+REQUEST_TIMEOUT = 15
+MAX_CONCURRENCY = 16
+MAX_CONNECTIONS = 32
+# Fetched pages waiting for the extractor thread
+QUEUE_SIZE = 8
+CHECKPOINT_EVERY = 10
+MAX_DRIVER_FAILURES = 2
+# Google's maximum page size, and how many pages to walk per query
+RESULTS_PER_PAGE = 100
+RESULT_PAGES = 3
+# Shown instead of results once start= runs past the last page
+NO_RESULTS_MARKER = "did not match any documents"
+# Google serves this interstitial instead of results when it suspects a bot
+CAPTCHA_RE = re.compile(r"detected unusual traffic", re.IGNORECASE)
+# Matched against raw bytes; image file names like logo@2x.png are filtered out afterwards
+EMAIL_RE = (re2 or re).compile(rb'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,24}')
+IMAGE_SUFFIXES = (b".png", b".jpg", b".jpeg", b".gif", b".webp")
+# RFC 5321 length limits, used to size the window scanned around each '@'
+MAX_LOCAL_PART = 64
+MAX_DOMAIN = 255
+# Same extraction run inside the browser, so only the matches cross the WebDriver socket
+EMAIL_JS = """
+const re = /[A-Za-z0-9._%+\\-]+@[A-Za-z0-9.\\-]+\\.[A-Za-z]{2,24}/g;
+const found = document.documentElement.outerHTML.match(re) || [];
+return Array.from(new Set(found)).filter(e => !/\\.(png|jpe?g|gif|webp)$/i.test(e));
+"""
+# Number of organic result blocks on a Google results page
+RESULT_COUNT_JS = "return document.querySelectorAll('div.g, div.MjjYud').length"
+# Resolved once at import; None lets Selenium Manager find it
+CHROMEDRIVER_PATH = shutil.which("chromedriver")
+# Point at a Selenium Grid (e.g. http://localhost:4444/wd/hub) to use its browsers instead of a local chromedriver
+SELENIUM_REMOTE_URL = os.environ.get("SELENIUM_REMOTE_URL")
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36 Edg/135.0.0.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/18.3 Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:131.0) Gecko/20100101 Firefox/131.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:136.0) Gecko/20100101 Firefox/136.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:136.0) Gecko/20100101 Firefox/136.0",
+    "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:136.0) Gecko/20100101 Firefox/136.0"
+]
+ACCEPT_LANGUAGES = [
+    "en-US,en;q=0.9",
+    "en-GB,en;q=0.8",
+    "en-US,en;q=0.8,es;q=0.6",
+    "en-CA,en;q=0.9,fr-CA;q=0.7",
+    "en-AU,en;q=0.9"
+]
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[logging.StreamHandler(), logging.FileHandler("scraper.log")]
+)
+
+# A single browser is shared by all searches for CAPTCHA fallbacks, one page at a time
+driver = None
+driver_lock = threading.Lock()
+consecutive_failures = 0
+# Set once scrape() starts tearing down, so fallback threads it can't cancel don't open a new browser
+driver_shutdown = threading.Event()
+# One chromedriver process serves every browser session started during the run
+chromedriver_service = None
+
+def load_checkpoint(checkpoint_file=CHECKPOINT_FILE + ".zst"):
+    """
+    Load existing results from the checkpoint file to resume scraping.
+    An uncompressed checkpoint left by older runs (the same name without .zst) is used if
+    no compressed one exists yet.
+    """
+    legacy_file = checkpoint_file[:-len(".zst")] if checkpoint_file.endswith(".zst") else None
+    if os.path.exists(checkpoint_file):
+        path, compressed = checkpoint_file, True
+    elif legacy_file and os.path.exists(legacy_file):
+        path, compressed = legacy_file, False
+    else:
+        return {}
+
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+        if compressed and content:
+            content = CHECKPOINT_DECOMPRESSOR.decompress(content)
+        content = content.strip()
+        if not content:
+            logging.info(f"⚠️ Checkpoint file {path} is empty. Starting fresh.")
+            return {}
+        return orjson.loads(content)
+    except (orjson.JSONDecodeError, zstd.ZstdError) as e:
+        logging.error(f"❌ Corrupted checkpoint file: {e}. Starting fresh.")
+        return {}
+    except Exception as e:
+        logging.error(f"❌ Error loading checkpoint file: {e}")
+        return {}
+
+def save_checkpoint(email_results, checkpoint_file=CHECKPOINT_FILE + ".zst"):
+    """
+    Save current results to the checkpoint file.
+    """
+    try:
+        # Write to a temp file and rename so an interrupted save never truncates the checkpoint
+        tmp_file = checkpoint_file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(CHECKPOINT_COMPRESSOR.compress(orjson.dumps(email_results)))
+        os.replace(tmp_file, checkpoint_file)
+        logging.info(f"💾 Checkpoint saved to: {checkpoint_file}")
+    except Exception as e:
+        logging.error(f"❌ Error saving checkpoint: {str(e)}")
+
+def get_command_executor(chrome_options):
+    """
+    Return a connection to open sessions against: the Selenium Grid if SELENIUM_REMOTE_URL
+    is set, otherwise a local chromedriver started once and reused. The Chromium connection
+    also exposes Chrome DevTools commands (executeCdpCommand) on the remote session.
+    """
+    global chromedriver_service
+
+    if SELENIUM_REMOTE_URL:
+        url = SELENIUM_REMOTE_URL
+    else:
+        if chromedriver_service is None:
+            service = Service(executable_path=CHROMEDRIVER_PATH, log_output=os.devnull)
+            if not service.path:
+                service.path = DriverFinder(service, chrome_options).get_driver_path()
+            service.start()
+            atexit.register(service.stop)
+            chromedriver_service = service
+        url = chromedriver_service.service_url
+    return ChromiumRemoteConnection(remote_server_addr=url, vendor_prefix="goog", browser_name="chrome")
+
+def initialize_driver(extension_path, extension_path2):
+    """
+    Initialize the Chrome WebDriver with specified extensions.
+    """
+    if not os.path.exists(extension_path):
+        raise FileNotFoundError(f"Extension file not found at: {extension_path}")
+    if not os.path.exists(extension_path2):
+        raise FileNotFoundError(f"Buster extension file not found at: {extension_path2}")
+
+    chrome_options = Options()
+    if HEADLESS:
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        # Skip downloading images and stylesheets; only the page text is scraped
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.stylesheets": 2
+        })
+    else:
+        chrome_options.add_argument("--start-maximized")
+    chrome_options.add_extension(extension_path)
+    chrome_options.add_extension(extension_path2)
+    chrome_options.add_argument(f"user-agent={random.choice(USER_AGENTS)}")
+    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+
+    try:
+        driver = webdriver.Remote(command_executor=get_command_executor(chrome_options), options=chrome_options)
+        return driver
+    except Exception as e:
+        logging.error(f"❌ Error initializing WebDriver: {str(e)}")
+        return None
+
+def fetch_with_driver(driver, url):
+    """
+    Load a results page in the browser, scroll to trigger lazy loading and return the emails on it.
+    Only used when Google answers the plain HTTP request with a CAPTCHA.
+    """
+    # Small jitter and a fresh identity so consecutive browser requests don't look machine-paced
+    time.sleep(random.uniform(MIN_DELAY, MAX_DELAY))
+    driver.execute("executeCdpCommand", {
+        "cmd": "Network.setUserAgentOverride",
+        "params": {"userAgent": random.choice(USER_AGENTS), "acceptLanguage": random.choice(ACCEPT_LANGUAGES)}
+    })
+    driver.get(url)
+
+    # Scroll to load more results, stopping as soon as a scroll adds no new result blocks
+    prev_count = 0
+    for _ in range(MAX_SCROLLS):
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        time.sleep(SCROLL_PAUSE)
+        count = driver.execute_script(RESULT_COUNT_JS)
+        if count == prev_count:
+            break
+        prev_count = count
+
+    return set(driver.execute_script(EMAIL_JS))
+
+def extract_emails(page_html):
+    """
+    Return the unique email addresses found in a page's HTML (str or bytes).
+    bytes.find jumps straight to each '@', so EMAIL_RE only runs on a small
+    window around it instead of over the whole document.
+    """
+    html = page_html.encode() if isinstance(page_html, str) else page_html
+    emails = set()
+    i = 0
+    while (at := html.find(b"@", i)) >= 0:
+        # Never look back past the previous match, just as a full-document scan wouldn't
+        lo = max(i, at - MAX_LOCAL_PART)
+        window = html[lo:at + MAX_DOMAIN + 1]
+        match = next((m for m in EMAIL_RE.finditer(window) if m.start() <= at - lo < m.end()), None)
+        if match is None:
+            i = at + 1
+            continue
+        email = match.group(0)
+        if not email.lower().endswith(IMAGE_SUFFIXES):
+            emails.add(email.decode())
+        i = lo + match.end()
+    return emails
+
+def fetch_with_recovery(url, extension_paths):
+    """
+    Fetch a page with the shared browser, recovering from WebDriver errors in place.
+    A failed page is retried once on a blank, cookie-free session; Chrome is only
+    restarted after MAX_DRIVER_FAILURES consecutive failures. Blocking: run it off the event loop.
+    """
+    global driver, consecutive_failures
+
+    with driver_lock:
+        while True:
+            if driver_shutdown.is_set():
+                raise WebDriverException("Scraping is shutting down; skipping the browser fallback.")
+            if not driver:
+                driver = initialize_driver(*extension_paths)
+                if not driver:
+                    raise Exception("Failed to initialize WebDriver")
+            try:
+                emails = fetch_with_driver(driver, url)
+                consecutive_failures = 0
+                return emails
+            except WebDriverException as e:
+                consecutive_failures += 1
+                if consecutive_failures >= MAX_DRIVER_FAILURES:
+                    # A crashed Chrome fails to quit too; drop it regardless so the next fallback restarts it
+                    try:
+                        driver.quit()
+                    except WebDriverException:
+                        pass
+                    driver = None
+                    consecutive_failures = 0
+                    logging.info("🔄 WebDriver will be restarted for the next CAPTCHA fallback.")
+                    raise
+                logging.warning(f"⚠️ WebDriver error, resetting the browser session and retrying: {e}")
+                try:
+                    driver.get("about:blank")
+                    driver.delete_all_cookies()
+                except WebDriverException:
+                    pass
+
+def close_driver():
+    """
+    Quit the shared browser once any in-flight fallback has released it.
+    Blocking: run it off the event loop.
+    """
+    global driver
+
+    with driver_lock:
+        if driver:
+            try:
+                driver.quit()
+                logging.info("🛑 Browser closed.")
+            except WebDriverException as e:
+                logging.error(f"❌ Error closing browser: {e}")
+            driver = None
+
+def random_headers():
+    """
+    Return request headers with a randomly chosen User-Agent and Accept-Language,
+    so consecutive searches don't share one easily fingerprinted identity.
+    """
+    return {"User-Agent": random.choice(USER_AGENTS), "Accept-Language": random.choice(ACCEPT_LANGUAGES)}
+
+def build_client():
+    """
+    Create the HTTP/2 client shared by all searches, so concurrent queries are
+    multiplexed over a few TLS connections to Google.
+    """
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=3,
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS)
+    )
+    # Google answers suspected bots with a redirect to its CAPTCHA page (followed below).
+    # http2=True is repeated here so a missing h2 package fails at startup, not mid-run
+    return httpx.AsyncClient(
+        transport=transport,
+        http2=True,
+        timeout=REQUEST_TIMEOUT,
+        follow_redirects=True
+    )
+
+def cache_path(url):
+    """
+    Return the SERP cache file for a URL.
+    """
+    return os.path.join(CACHE_DIR, hashlib.sha1(url.encode()).hexdigest() + ".html.gz")
+
+async def cached_fetch(client, url, use_cache=True):
+    """
+    Return (status_code, html) for a URL, served from the SERP cache when present.
+    With use_cache=False the page is always fetched again and the cache refreshed.
+    Only successful, CAPTCHA-free pages are cached.
+    """
+    path = cache_path(url)
+    if use_cache and os.path.exists(path):
+        with gzip.open(path, "rb") as f:
+            return 200, f.read().decode()
+
+    # Jittered spacing between live requests, like the browser fallback
+    await asyncio.sleep(random.uniform(MIN_DELAY, MAX_DELAY))
+    response = await client.get(url, headers=random_headers())
+    page_html = response.text
+    if response.status_code == 200 and not CAPTCHA_RE.search(page_html):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Same temp-file-and-rename as the checkpoint so a killed run can't leave a truncated page
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wb") as f:
+            f.write(page_html.encode())
+        os.replace(tmp_path, path)
+    return response.status_code, page_html
+
+def search_url(query, start=0):
+    """
+    Return the Google results URL for a query, starting at result number start.
+    """
+    # Properly encode the query for the URL
+    encoded_query = urllib.parse.quote(query)
+    return f'https://www.google.com/search?q={encoded_query}&num={RESULTS_PER_PAGE}&start={start}'
+
+async def fetch_all_pages(client, query, use_cache=True):
+    """
+    Fetch up to RESULT_PAGES static result pages for a query and return their HTML joined,
+    or None if Google answered any of them with a CAPTCHA.
+    Paging with start= replaces scrolling, so no JavaScript has to run.
+    """
+    pages = []
+    for page in range(RESULT_PAGES):
+        url = search_url(query, page * RESULTS_PER_PAGE)
+        logging.info(f"🌐 Constructed URL: {url}")
+        status_code, page_html = await cached_fetch(client, url, use_cache)
+        if CAPTCHA_RE.search(page_html):
+            return None
+        if status_code != 200:
+            if not pages:
+                raise httpx.HTTPError(f"HTTP {status_code} for {url}")
+            break
+        if NO_RESULTS_MARKER in page_html:
+            break
+        pages.append(page_html)
+    return "\n".join(pages)
+
+async def search(client, query, key, extension_paths, use_cache=True):
+    """
+    Fetch the results for a single query and return (key, page_html, emails).
+    Normally only page_html is set, for the extractor thread to scan. When Google shows
+    a CAPTCHA the shared browser extracts the emails instead and page_html is None.
+    """
+    logging.info(f"🔍 Searching: {query}")
+    page_html = await fetch_all_pages(client, query, use_cache)
+    if page_html is None:
+        logging.warning(f"🤖 CAPTCHA detected for {key}. Falling back to the browser.")
+        emails = await asyncio.to_thread(fetch_with_recovery, search_url(query), extension_paths)
+        return key, None, emails
+    return key, page_html, None
+
+def extract_cached_page(path):
+    """
+    Return (path, emails) for one gzipped SERP cache file. Runs in a worker process.
+    """
+    with gzip.open(path, "rb") as f:
+        return path, extract_emails(f.read())
+
+def reextract_from_cache(query_iter, key_fn):
+    """
+    Rebuild results for the (query, item) searches from query_iter using only the SERP cache,
+    spreading the regex work over all CPU cores. Searches with no cached pages keep their
+    checkpointed result; the updated results are checkpointed and returned.
+    """
+    email_results = load_checkpoint()
+    path_keys = {}
+    for query, item in query_iter:
+        key = key_fn(item)
+        for page in range(RESULT_PAGES):
+            path = cache_path(search_url(query, page * RESULTS_PER_PAGE))
+            if os.path.exists(path):
+                path_keys[path] = key
+    logging.info(f"🗂️ Re-extracting emails from {len(path_keys)} cached page(s).")
+
+    found = {}
+    with ProcessPoolExecutor() as executor:
+        # Chunks amortize the per-task pickling/IPC cost over many small files
+        for path, emails in executor.map(extract_cached_page, path_keys, chunksize=32):
+            found.setdefault(path_keys[path], set()).update(emails)
+
+    for key, emails in found.items():
+        email_results[key] = sorted(emails)
+    save_checkpoint(email_results)
+    return email_results
+
+def extract_results(results_queue, email_results):
+    """
+    Consume (key, page_html, emails) items from search() until a None sentinel, storing
+    each result and checkpointing every CHECKPOINT_EVERY of them. Runs on its own thread
+    so regex work overlaps with the event loop waiting on Google.
+    """
+    completed = 0
+    while (item := results_queue.get()) is not None:
+        key, page_html, emails = item
+        if emails is None:
+            emails = extract_emails(page_html)
+        emails = sorted(emails)
+
+        email_results[key] = emails
+        logging.info(f"📧 Found {len(emails)} email(s) for: {key}")
+        for email in emails:
+            logging.info(email)
+
+        completed += 1
+        if completed % CHECKPOINT_EVERY == 0:
+            save_checkpoint(email_results)
+
+async def scrape(query_iter, key_fn, extension_paths, use_cache=True):
+    """
+    Run the (query, item) searches from query_iter and return all results keyed by key_fn(item).
+    Result pages come from the SERP cache unless use_cache is False.
+    Up to MAX_CONCURRENCY searches are in flight at once, feeding a bounded queue that
+    a single extractor thread drains.
+    """
+    driver_shutdown.clear()
+    email_results = load_checkpoint()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    results_queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+    # Work out what is left once, rather than re-checking the checkpoint per search
+    queries = [(query, key_fn(item)) for query, item in query_iter]
+    pending = [(query, key) for query, key in queries if key not in email_results]
+    logging.info(f"⏭️ {len(pending)} pending of {len(queries)} searches; the rest are already processed.")
+
+    async def run_search(client, query, key):
+        async with semaphore:
+            try:
+                item = await search(client, query, key, extension_paths, use_cache)
+            except httpx.HTTPError as e:
+                logging.error(f"❌ Request error for {key}: {e}")
+                return
+            except WebDriverException as e:
+                logging.error(f"❌ WebDriver error for {key}: {e}")
+                return
+        # Blocks (off the event loop) while the extractor is QUEUE_SIZE pages behind
+        await asyncio.to_thread(results_queue.put, item)
+
+    extractor = asyncio.create_task(asyncio.to_thread(extract_results, results_queue, email_results))
+    try:
+        async with build_client() as client:
+            tasks = [asyncio.create_task(run_search(client, query, key)) for query, key in pending]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                # Cancelling a task doesn't stop a fallback thread it started; this keeps such
+                # threads from opening a browser after the one below has been closed
+                driver_shutdown.set()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    except Exception as e:
+        logging.error(f"❌ Error during scraping: {str(e)}")
+
+    finally:
+        # Always stop the extractor, even if the client never opened, or asyncio.run() would
+        # wait on its thread forever; it finishes what is already queued before the final save
+        await asyncio.to_thread(results_queue.put, None)
+        await extractor
+        save_checkpoint(email_results)
+        await asyncio.to_thread(close_driver)
+
+    return email_results